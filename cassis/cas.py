@@ -1,10 +1,14 @@
+import heapq
 import itertools
+import re
 import sys
 import warnings
-from collections import defaultdict
-from functools import lru_cache
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, deque
+from operator import attrgetter
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple, Union
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import attr
 import deprecation
@@ -12,10 +16,14 @@ from attr import validators
 from sortedcontainers import SortedKeyList
 
 from cassis.typesystem import (
+    FEATURE_BASE_NAME_BEGIN,
+    FEATURE_BASE_NAME_END,
     FEATURE_BASE_NAME_HEAD,
+    FEATURE_BASE_NAME_SOFA,
     TYPE_NAME_FS_ARRAY,
     TYPE_NAME_FS_LIST,
     TYPE_NAME_SOFA,
+    Feature,
     FeatureStructure,
     Type,
     TypeCheckError,
@@ -29,13 +37,21 @@ _validator_optional_string = validators.optional(validators.instance_of(str))
 
 NAME_DEFAULT_SOFA = "_InitialView"
 
+_PATTERN_NON_BMP_CHARACTER = re.compile(r"[^\u0000-\uffff]")
 
-@lru_cache(maxsize=5000)
-def _get_size_in_utf16_bytes(c: str) -> int:
-    return len(c.encode("utf-16-le")) // 2
+# The begin offsets cached for an index are updated in place if at most one annotation per this many indexed ones is
+# added at once, otherwise they are rebuilt
+_MAX_BEGIN_OFFSET_INSERTIONS_RATIO = 64
+
+# How `Cas._find_all_fs` finds the feature structures a feature points to
+_TRAVERSE_REFERENCE = 0
+_TRAVERSE_FS_ARRAY_MEMBERS = 1
+_TRAVERSE_FS_LIST_MEMBERS = 2
 
 
 class IdGenerator:
+    __slots__ = ("_next_id",)
+
     def __init__(self, initial_id: int = 1):
         self._next_id = initial_id
 
@@ -56,48 +72,100 @@ class Utf16CodepointOffsetConverter:
     """
 
     def __init__(self):
-        self._external_to_python: Union[Dict[int, int], None] = None
-        self._python_to_external: Union[Dict[int, int], None] = None
+        # Both mappings are dense sequences indexed by offset. Offsets pointing into the middle of a surrogate pair
+        # have no Python counterpart and are marked with -1 in the mapping from external offsets.
+        self._external_to_python_mapping: Optional[Sequence[int]] = None
+        self._python_to_external_mapping: Optional[Sequence[int]] = None
+
+        # The string the mappings are for. Many CASes never convert any offsets, so the mappings are only built when
+        # they are first needed.
+        self._sofa_string: Optional[str] = None
 
     def create_offset_mapping(self, sofa_string: str) -> None:
-        if sofa_string is None:
+        if sofa_string is None or sofa_string is self._sofa_string or sofa_string == self._sofa_string:
             return
 
-        sizes_in_utf16_bytes = map(_get_size_in_utf16_bytes, sofa_string)
-        accumulated_sizes = [0] + list(itertools.accumulate(sizes_in_utf16_bytes))
+        self._sofa_string = sofa_string
+        self._external_to_python_mapping = None
+        self._python_to_external_mapping = None
 
-        self._python_to_external = dict(zip(range(len(accumulated_sizes)), accumulated_sizes))
-        self._external_to_python = dict(zip(accumulated_sizes, range(len(accumulated_sizes))))
+    @property
+    def _external_to_python(self) -> Optional[Sequence[int]]:
+        if self._external_to_python_mapping is None and self._sofa_string is not None:
+            self._build_offset_mapping()
+        return self._external_to_python_mapping
+
+    @property
+    def _python_to_external(self) -> Optional[Sequence[int]]:
+        if self._python_to_external_mapping is None and self._sofa_string is not None:
+            self._build_offset_mapping()
+        return self._python_to_external_mapping
+
+    def _build_offset_mapping(self) -> None:
+        sofa_string = self._sofa_string
+
+        # Characters outside the Basic Multilingual Plane take two UTF-16 code units, all others take one. So the
+        # external offset of each position is its Python offset shifted by the number of such characters before it.
+        # These characters are rare, so we only look at them and fill in the runs of BMP characters in between.
+        if sofa_string.isascii():
+            non_bmp_positions = []
+        else:
+            non_bmp_positions = [match.start() for match in _PATTERN_NON_BMP_CHARACTER.finditer(sofa_string)]
+        python_length = len(sofa_string) + 1
+
+        # Without such characters, both kinds of offsets are the same and a range serves as mapping in both directions
+        if not non_bmp_positions:
+            self._python_to_external_mapping = self._external_to_python_mapping = range(python_length)
+            return
+
+        external_length = python_length + len(non_bmp_positions)
+
+        python_to_external = array("q")
+        external_to_python = array("q", [-1]) * external_length
+        shift = 0
+        start = 0
+        for stop in itertools.chain(non_bmp_positions, (python_length - 1,)):
+            python_to_external.extend(range(start + shift, stop + shift + 1))
+            external_to_python[start + shift : stop + shift + 1] = array("q", range(start, stop + 1))
+            shift += 1
+            start = stop + 1
+
+        self._python_to_external_mapping = python_to_external
+        self._external_to_python_mapping = external_to_python
 
     def external_to_python(self, idx: Optional[int]) -> Optional[int]:
         if idx is None:
             return None
 
-        if self._external_to_python is None:
+        external_to_python = self._external_to_python
+        if external_to_python is None:
             return idx
 
-        try:
-            return self._external_to_python[idx]
-        except KeyError:
-            warnings.warn(
-                f"Not mapping external offset [{idx}] which is not valid within the internal range [0-{list(self._external_to_python)[-1]}]"
-            )
-            return idx
+        if 0 <= idx < len(external_to_python):
+            result = external_to_python[idx]
+            if result >= 0:
+                return result
+
+        warnings.warn(
+            f"Not mapping external offset [{idx}] which is not valid within the internal range [0-{len(external_to_python) - 1}]"
+        )
+        return idx
 
     def python_to_external(self, idx: Optional[int]) -> Optional[int]:
         if idx is None:
             return None
 
-        if self._python_to_external is None:
+        python_to_external = self._python_to_external
+        if python_to_external is None:
             return idx
 
-        try:
-            return self._python_to_external[idx]
-        except KeyError:
-            warnings.warn(
-                f"Not mapping internal offset [{idx}] which is not valid within the external range [0-{list(self._python_to_external)[-1]}]"
-            )
-            return idx
+        if 0 <= idx < len(python_to_external):
+            return python_to_external[idx]
+
+        warnings.warn(
+            f"Not mapping internal offset [{idx}] which is not valid within the external range [0-{len(python_to_external) - 1}]"
+        )
+        return idx
 
 
 @attr.s(slots=True)
@@ -145,9 +213,19 @@ class Sofa:
             self._offset_converter.create_offset_mapping(self._sofaString)
 
 
+class _TypeIndices(dict):
+    """Maps type names to the index of the respective type. Looking up a type that has no index yet returns an empty
+    index instead of raising. The empty index is not stored, so only types that have been indexed are listed."""
+
+    def __missing__(self, type_name: str) -> SortedKeyList:
+        return SortedKeyList(key=_sort_key_annotation)
+
+
 class View:
     """A view into a CAS contains a subset of feature structures and annotations."""
 
+    __slots__ = ("sofa", "_indices", "_pending", "_begin_offsets")
+
     def __init__(self, sofa: Sofa):
         """Creates a new view for the given sofa.
 
@@ -156,10 +234,19 @@ class View:
         """
         self.sofa = sofa
 
-        # Annotations are sorted by begin index first (smaller first). If begin
-        # is equal, sort by end index, smaller first. This is the same as
-        # comparing a Python tuple of (begin, end)
-        self._indices = defaultdict(lambda: SortedKeyList(key=_sort_func))
+        # Maps type names to a sorted list of the annotations of that type. The lists are created on demand by
+        # `_create_index`, which picks their sort key, see `_sort_key_for_type`.
+        self._indices: Dict[str, SortedKeyList] = _TypeIndices()
+
+        # Annotations are not sorted into the index right away. Instead, they are buffered per type and merged
+        # into the index in one go the next time the index is read. Loading or creating many annotations before
+        # querying them thus only costs one sort per type instead of one insertion per annotation. The buffer is keyed
+        # by type name rather than by type, as names are hashed in C while `Type` computes its hash in Python.
+        self._pending: Dict[str, List[FeatureStructure]] = defaultdict(list)
+
+        # Maps type names to the begin offsets of the annotations in the respective index, in index order. These are
+        # built when first needed and then kept in step with the index, see `_index_pending_annotations`.
+        self._begin_offsets: Dict[str, array] = {}
 
     @property
     def type_index(self) -> Dict[str, SortedKeyList]:
@@ -168,10 +255,25 @@ class View:
         Returns:
             A dictionary mapping type names to annotations of this type.
         """
+        if self._pending:
+            self._index_pending_annotations()
         return self._indices
 
     def add_annotation_to_index(self, annotation: FeatureStructure):
-        self._indices[annotation.type.name].add(annotation)
+        self._pending[annotation.type.name].append(annotation)
+
+    def add_annotations_to_index(self, annotations: Iterable[FeatureStructure]):
+        """Adds several annotations at once to the index of this view.
+
+        The annotations are grouped by type first so that the index of each type is updated in one go instead of
+        inserting the annotations one by one.
+
+        Args:
+            annotations: An iterable of annotations to add.
+        """
+        pending = self._pending
+        for annotation in annotations:
+            pending[annotation.type.name].append(annotation)
 
     def get_all_annotations(self) -> List[FeatureStructure]:
         """Gets all the annotations in this view.
@@ -180,10 +282,17 @@ class View:
             A list of all annotations in this view.
 
         """
-        result = []
-        for annotations_by_type in self._indices.values():
-            result.extend(annotations_by_type)
-        return result
+        return list(self.iter_all_annotations())
+
+    def iter_all_annotations(self) -> Iterator[FeatureStructure]:
+        """Iterates over all the annotations in this view without copying them into a list first. The index of this
+        view must not be changed during the iteration.
+
+        Returns:
+            An iterator over all annotations in this view.
+
+        """
+        return itertools.chain.from_iterable(self.type_index.values())
 
     def remove_annotation_from_index(self, annotation: FeatureStructure):
         """Removes an annotation from an index. This throws if the
@@ -192,12 +301,64 @@ class View:
         Args:
             annotation: The annotation to remove.
         """
-        self._indices[annotation.type.name].remove(annotation)
+        if self._pending:
+            self._index_pending_annotations()
+
+        # Feature structures compare equal to each other, so we cannot rely on `SortedKeyList.remove` and instead
+        # look for the very same object among all annotations sharing its sort key.
+        index = self._indices.get(annotation.type.name)
+        if index is not None:
+            key = index.key(annotation)
+            for i in range(index.bisect_key_left(key), index.bisect_key_right(key)):
+                if index[i] is annotation:
+                    del index[i]
+                    begin_offsets = self._begin_offsets.get(annotation.type.name)
+                    if begin_offsets is not None:
+                        del begin_offsets[i]
+                    return
+
+        raise ValueError(f"{annotation!r} not in index")
+
+    def _get_or_create_index(self, type_: Type) -> SortedKeyList:
+        index = self._indices.get(type_.name)
+        if index is None:
+            index = _create_index(type_)
+            self._indices[type_.name] = index
+        return index
+
+    def _index_pending_annotations(self):
+        for type_name, annotations in self._pending.items():
+            self._get_or_create_index(annotations[0].type).update(annotations)
+
+            # Inserting a begin offset into the array only moves memory around, while rebuilding it reads the begin
+            # offset of every annotation in the index. Inserting is thus much cheaper unless many annotations were
+            # added at once. Keeping the array up to date means that alternating between adding annotations and
+            # selecting them does not rebuild it every time.
+            begin_offsets = self._begin_offsets.get(type_name)
+            if begin_offsets is not None:
+                if len(annotations) * _MAX_BEGIN_OFFSET_INSERTIONS_RATIO <= len(begin_offsets):
+                    for begin in map(_get_begin, annotations):
+                        insort(begin_offsets, begin)
+                else:
+                    del self._begin_offsets[type_name]
+        self._pending.clear()
+
+    def _get_begin_offsets(self, type_name: str) -> array:
+        """Returns the begin offsets of all annotations in the index of the given type as a flat array. This allows
+        binary searching for offsets without calling the sort key of the index for every comparison.
+
+        Like the sort order of the index itself, the array reflects the begin offsets the annotations had when they
+        were indexed."""
+        begin_offsets = self._begin_offsets.get(type_name)
+        if begin_offsets is None:
+            begin_offsets = array("q", map(_get_begin, self.type_index[type_name]))
+            self._begin_offsets[type_name] = begin_offsets
+        return begin_offsets
 
 
 class Index:
     def __init__(self, typesystem: TypeSystem):
-        self._data = SortedKeyList(key=_sort_func)
+        self._data = SortedKeyList(key=_sort_key_annotation)
         self._typesystem = typesystem
 
 
@@ -221,10 +382,9 @@ class Cas:
         self._typesystem = typesystem if typesystem else TypeSystem()
         self._lenient = lenient
 
-        # When new attributes are added, they also need to be added in Cas::_copy. The copying
-        # relies on the fact that all the members of the Cas are mutable references. It is not
-        # possible right now to add not-mutable references because the view functionality heavily
-        # relies on this functionality.
+        # Views share the state of this CAS, see Cas::_copy. The copying relies on the fact that all
+        # the members of the Cas are mutable references. It is not possible right now to add not-mutable
+        # references because the view functionality heavily relies on this functionality.
         self._sofas = {}
         self._views = {}
 
@@ -320,15 +480,12 @@ class Cas:
             keep_id: Keep the XMI id of `annotation` if true, else generate a new one.
 
         """
-        if not self._lenient and not self._typesystem.contains_type(annotation.type.name):
-            msg = f"Typesystem of CAS does not contain type [{annotation.type.name}]. "
-            msg += "Either add the type to the type system or specify `lenient=True` when creating the CAS."
-            raise RuntimeError(msg)
+        self._check_type_is_known(annotation.type)
 
         if keep_id and annotation.xmiID is not None:
             next_id = annotation.xmiID
         else:
-            next_id = self._get_next_xmi_id()
+            next_id = self._xmi_id_generator.generate_id()
 
         annotation.xmiID = next_id
         if hasattr(annotation, "sofa"):
@@ -336,6 +493,12 @@ class Cas:
 
         self._current_view.add_annotation_to_index(annotation)
 
+    def _check_type_is_known(self, type_: Type):
+        if not self._lenient and not self._typesystem.contains_type(type_.name):
+            msg = f"Typesystem of CAS does not contain type [{type_.name}]. "
+            msg += "Either add the type to the type system or specify `lenient=True` when creating the CAS."
+            raise RuntimeError(msg)
+
     @deprecation.deprecated(details="Use add()")
     def add_annotation(self, annotation: FeatureStructure, keep_id: Optional[bool] = True):
         """Adds an annotation to this Cas.
@@ -347,15 +510,43 @@ class Cas:
         """
         self.add(annotation, keep_id)
 
-    def add_all(self, annotations: Iterable[FeatureStructure]):
+    def add_all(self, annotations: Iterable[FeatureStructure], keep_id: Optional[bool] = True):
         """Adds several annotations at once to this CAS.
 
         Args:
             annotations: An iterable of annotations to add.
+            keep_id: Keep the XMI ids of the `annotations` if true, else generate new ones.
 
         """
-        for annotation in annotations:
-            self.add(annotation)
+        # Everything that does not depend on the individual annotation is looked up only once
+        check_type_is_known = self._check_type_is_known
+        generate_id = self._xmi_id_generator.generate_id
+        sofa = self.get_sofa()
+
+        # Annotations usually share a handful of types, so each type only needs to be checked once. We also note
+        # whether the type has a sofa feature instead of probing every annotation for it.
+        has_sofa_by_type_name: Dict[str, bool] = {}
+
+        prepared = []
+        try:
+            for annotation in annotations:
+                type_ = annotation.type
+                has_sofa = has_sofa_by_type_name.get(type_.name)
+                if has_sofa is None:
+                    check_type_is_known(type_)
+                    has_sofa = type_.get_feature(FEATURE_BASE_NAME_SOFA) is not None
+                    has_sofa_by_type_name[type_.name] = has_sofa
+
+                if not keep_id or annotation.xmiID is None:
+                    annotation.xmiID = generate_id()
+
+                if has_sofa:
+                    annotation.sofa = sofa
+
+                prepared.append(annotation)
+        finally:
+            # Like adding the annotations one by one, the annotations before one that cannot be added are indexed
+            self._current_view.add_annotations_to_index(prepared)
 
     @deprecation.deprecated(details="Use add_all()")
     def add_annotations(self, annotations: Iterable[FeatureStructure]):
@@ -400,6 +591,21 @@ class Cas:
         sofa = self.get_sofa()
         return sofa.sofaString[annotation.begin : annotation.end]
 
+    def get_covered_texts(self, annotations: Iterable[FeatureStructure]) -> List[str]:
+        """Gets the texts that are covered by `annotations`.
+
+        This is equivalent to calling `get_covered_text` for each annotation, but looks up the sofa string only once.
+
+        Args:
+            annotations: The annotations whose covered texts are to be retrieved.
+
+        Returns:
+            The texts covered by `annotations`, in the same order
+
+        """
+        sofa_string = self.get_sofa().sofaString
+        return [sofa_string[annotation.begin : annotation.end] for annotation in annotations]
+
     def select(self, type_: Union[Type, str]) -> List[FeatureStructure]:
         """Finds all annotations of type `type_name`.
 
@@ -430,14 +636,7 @@ class Cas:
 
         """
         t = type_ if isinstance(type_, Type) else self.typesystem.get_type(type_)
-        c_begin = covering_annotation.begin
-        c_end = covering_annotation.end
-
-        result = []
-        for annotation in self._get_feature_structures_in_range(t, c_begin, c_end):
-            if annotation.begin >= c_begin and annotation.end <= c_end:
-                result.append(annotation)
-        return result
+        return self._get_feature_structures_in_range(t, covering_annotation.begin, covering_annotation.end)
 
     def select_covering(self, type_: Union[Type, str], covered_annotation: FeatureStructure) -> List[FeatureStructure]:
         """Returns a list of annotations that cover the given annotation.
@@ -478,33 +677,42 @@ class Cas:
 
     def _get_feature_structures(self, type_: Type) -> List[FeatureStructure]:
         """Returns a list of all feature structures of type `type_name` and child types."""
-        types = {c.name for c in type_.descendants}
+        type_index = self._current_view.type_index
 
-        result = []
-        for name in types:
-            result.extend(self._current_view.type_index[name])
+        # Most selections are for leaf types, so we can skip collecting the descendants. We still return a copy of
+        # the index as callers may add or remove annotations while iterating over the result.
+        if not type_._children:
+            annotations = type_index.get(type_.name)
+            return list(annotations) if annotations else []
 
-        return result
+        # Only few of the descendants of a type usually have annotations, so we only look at the populated indices
+        names = type_index.keys() & type_._descendant_names
+        if len(names) == 1:
+            return list(type_index[names.pop()])
+
+        return list(itertools.chain.from_iterable(type_index[name] for name in names))
 
     def _get_feature_structures_in_range(self, type_: Type, begin: int, end: int) -> List[FeatureStructure]:
         """Returns a list of all feature structures of type `type_name` and child types.
-        Only features are returned that are in [begin, end] or close to it. If you use this function,
-        you should always check bound in the calling method.
+        Only features are returned that are fully contained in [begin, end].
         """
-        types = {c.name for c in type_.descendants}
-
-        result = []
-        for name in types:
-            annotations = self._current_view.type_index[name]
-
-            # We use binary search to find indices for the first and last annotations that are inside
-            # the window of [begin, end].
-            idx_begin = annotations.bisect_key_left((begin, begin))
-            idx_end = annotations.bisect_key_right((end, end))
-
-            result.extend(annotations[idx_begin:idx_end])
-
-        return result
+        hits = []
+        view = self._current_view
+        type_index = view.type_index
+        for name in type_index.keys() & type_._descendant_names:
+            annotations = type_index[name]
+            # Feature structures without offsets are never covered by anything
+            if annotations and annotations.key is _sort_key_annotation:
+                covered = _covered_in_index(annotations, view._get_begin_offsets(name), begin, end)
+                if covered:
+                    hits.append(covered)
+
+        # Usually only a single type has annotations in range, which are already sorted. Otherwise, we merge the
+        # sorted results of all types so that the annotations are returned in offset order.
+        if len(hits) == 1:
+            return hits[0]
+
+        return list(heapq.merge(*hits, key=_sort_key_annotation))
 
     # Sofa
 
@@ -727,17 +935,22 @@ class Cas:
         referenced by another feature structure as a feature."""
         all_fs = {}
 
-        openlist = []
+        openlist = deque()
         if seeds is not None:  # Using "is not None" to distinguish empty seeds from not using seeds at all
             openlist.extend(seeds)
         else:
-            for sofa in self.sofas:
-                view = self.get_view(sofa.sofaID)
-                openlist.extend(view.select_all())
+            # We only need the annotations of each view, so there is no need to create a CAS handle for it
+            for view in self._views.values():
+                openlist.extend(view.iter_all_annotations())
 
         ts = self.typesystem
+        generate_id = self._xmi_id_generator.generate_id
+
+        # Which features need to be followed only depends on the type, so we work this out once per type
+        traversal_plans: Dict[str, Tuple[Type, List[Tuple[Feature, int]]]] = {}
+
         while openlist:
-            fs = openlist.pop(0)
+            fs = openlist.popleft()
 
             # We do not want to return cas:NULL here as we handle serializing it later
             if fs.xmiID == 0:
@@ -745,12 +958,17 @@ class Cas:
 
             if fs.xmiID is None:
                 if generate_missing_ids:
-                    fs.xmiID = self._get_next_xmi_id()
+                    fs.xmiID = generate_id()
                 else:
                     raise ValueError(f"FS has no ID and ID generation is disabled! {fs}")
 
             existing_fs = all_fs.get(fs.xmiID)
-            if existing_fs is not None and existing_fs is not fs:
+            if existing_fs is not None:
+                # A feature structure can be queued several times before it is visited, but it only needs to be
+                # looked at once
+                if existing_fs is fs:
+                    continue
+
                 raise ValueError(
                     "Duplicate FS id [{fsId}] used for [{fs1}] and [{fs2}]".format(
                         fsId=fs.xmiID, fs1=existing_fs, fs2=fs
@@ -758,8 +976,14 @@ class Cas:
                 )
 
             all_fs[fs.xmiID] = fs
+            yield fs
 
-            t = ts.get_type(fs.type.name)
+            traversal_plan = traversal_plans.get(fs.type.name)
+            if traversal_plan is None:
+                t = ts.get_type(fs.type.name)
+                traversal_plan = (t, _get_features_to_traverse(ts, t, include_inlinable_arrays_and_lists))
+                traversal_plans[fs.type.name] = traversal_plan
+            t, features_to_traverse = traversal_plan
 
             # Arrays contents are handled separately - they only have one "virtual" feature: elements
             if t.supertype.name == "uima.cas.ArrayBase":
@@ -771,43 +995,31 @@ class Cas:
                 continue  # After processing any arrays, skip to the next FS in the openlist
 
             # For non-array types, we look at the features - this includes also FSList-types
-            for feature in t.all_features:
-                feature_name = feature.name
-
-                if feature_name == "sofa":
-                    continue
-
-                if ts.is_primitive(feature.rangeType):
-                    continue
-
-                feature_value = getattr(fs, feature_name)
+            for feature, traversal in features_to_traverse:
+                feature_value = getattr(fs, feature.name)
                 if feature_value is None:
                     continue
 
-                if (
-                    not include_inlinable_arrays_and_lists
-                    and not feature.multipleReferencesAllowed
-                    and (ts.is_array(feature.rangeType) or ts.is_list(feature.rangeType))
-                ):
-                    # For inlined FSArrays / FSList, we still need to scan their members
-                    if feature.rangeType.name == TYPE_NAME_FS_ARRAY and feature_value.elements:
+                # For inlined FSArrays / FSList, we still need to scan their members
+                if traversal == _TRAVERSE_FS_ARRAY_MEMBERS:
+                    if feature_value.elements:
                         for ref in feature_value.elements:
                             if not ref or ref.xmiID in all_fs:
                                 continue
                             openlist.append(ref)
-                    elif feature.rangeType.name == TYPE_NAME_FS_LIST and hasattr(feature_value, FEATURE_BASE_NAME_HEAD):
-                        v = feature_value
-                        while hasattr(v, FEATURE_BASE_NAME_HEAD):
-                            if not v.head or v.head.xmiID in all_fs:
-                                continue
+                    continue
+
+                if traversal == _TRAVERSE_FS_LIST_MEMBERS:
+                    v = feature_value
+                    while hasattr(v, FEATURE_BASE_NAME_HEAD):
+                        if v.head and v.head.xmiID not in all_fs:
                             openlist.append(v.head)
-                            v = v.tail
-                    # For primitive arrays / lists, we do not need to handle the elements
+                        v = v.tail
                     continue
 
                 if not hasattr(feature_value, "xmiID"):
                     raise AttributeError(
-                        f"Feature [{feature.domainType.name}:{feature_name}] should point to a [{feature.rangeType.name}] but the feature value is a [{type(feature_value)}] with the value [{feature_value}]"
+                        f"Feature [{feature.domainType.name}:{feature.name}] should point to a [{feature.rangeType.name}] but the feature value is a [{type(feature_value)}] with the value [{feature_value}]"
                     )
 
                 if feature_value.xmiID in all_fs:
@@ -815,8 +1027,6 @@ class Cas:
 
                 openlist.append(feature_value)
 
-        yield from all_fs.values()
-
     def _get_next_xmi_id(self) -> int:
         return self._xmi_id_generator.generate_id()
 
@@ -824,18 +1034,76 @@ class Cas:
         return self._sofa_num_generator.generate_id()
 
     def _copy(self) -> "Cas":
-        result = Cas(self._typesystem)
-        result._views = self._views
-        result._sofas = self._sofas
-        result._current_view = self._current_view
-        result._sofa_num_generator = self._sofa_num_generator
-        result._xmi_id_generator = self._xmi_id_generator
+        # Bypass `__init__` which would create a fresh initial view, sofa and id generators that we would
+        # immediately throw away again. Instead, the copy shares all members with this CAS.
+        result = Cas.__new__(Cas)
+        result.__dict__.update(self.__dict__)
         return result
 
 
-def _sort_func(a: FeatureStructure) -> Tuple[int, int, int]:
-    d = a.__slots__
-    if "begin" in d and "end" in d:
-        return a.begin, a.end, id(a)
-    else:
-        return sys.maxsize, sys.maxsize, id(a)
+# Annotations are sorted by begin index first (smaller first). If begin is equal, sort by end index, smaller first.
+# This is the same as comparing a Python tuple of (begin, end). Annotations with the same offsets remain in insertion
+# order.
+_sort_key_annotation = attrgetter(FEATURE_BASE_NAME_BEGIN, FEATURE_BASE_NAME_END)
+
+_get_begin = attrgetter(FEATURE_BASE_NAME_BEGIN)
+
+
+def _sort_key_non_annotation(fs: FeatureStructure) -> Tuple[int, int]:
+    # Feature structures without offsets are sorted after all annotations, in insertion order
+    return sys.maxsize, sys.maxsize
+
+
+def _covered_in_index(annotations: SortedKeyList, begin_offsets: array, begin: int, end: int) -> List[FeatureStructure]:
+    """Returns the annotations of a single type index that are fully contained in [begin, end].
+
+    `begin_offsets` holds the begin offsets the annotations had when they were indexed. It is only used to narrow
+    down the candidates, which are then checked against their current offsets. Annotations whose begin offset was
+    changed while they were indexed may thus be missed, but are never returned if they no longer lie in the window."""
+    # We use binary search on the begin offsets to find indices for the first and last annotations that start
+    # inside the window of [begin, end]. Candidates that are not inside the window according to their current
+    # offsets are then dropped.
+    idx_begin = bisect_left(begin_offsets, begin)
+    idx_end = bisect_right(begin_offsets, end)
+
+    return [a for a in annotations[idx_begin:idx_end] if begin <= a.begin and a.end <= end]
+
+
+def _get_features_to_traverse(
+    ts: TypeSystem, type_: Type, include_inlinable_arrays_and_lists: bool
+) -> List[Tuple[Feature, int]]:
+    """Returns the features of `type_` that can point to other feature structures, together with how the feature
+    structures they point to are to be found. Other features are left out as they never need to be traversed."""
+    result = []
+    for feature in type_.all_features:
+        if feature.name == "sofa" or ts.is_primitive(feature.rangeType):
+            continue
+
+        if (
+            not include_inlinable_arrays_and_lists
+            and not feature.multipleReferencesAllowed
+            and (ts.is_array(feature.rangeType) or ts.is_list(feature.rangeType))
+        ):
+            if feature.rangeType.name == TYPE_NAME_FS_ARRAY:
+                result.append((feature, _TRAVERSE_FS_ARRAY_MEMBERS))
+            elif feature.rangeType.name == TYPE_NAME_FS_LIST:
+                result.append((feature, _TRAVERSE_FS_LIST_MEMBERS))
+            # For primitive arrays / lists, we do not need to handle the elements
+            continue
+
+        result.append((feature, _TRAVERSE_REFERENCE))
+
+    return result
+
+
+def _create_index(type_: Type) -> SortedKeyList:
+    """Creates an empty index for feature structures of the given type."""
+    return SortedKeyList(key=_sort_key_for_type(type_))
+
+
+def _sort_key_for_type(type_: Type) -> Callable[[FeatureStructure], Tuple[int, int]]:
+    """Picks the sort key for the index of the given type. Whether a type has offsets is a static property of the
+    type, so we decide this once per index instead of checking every feature structure on every comparison."""
+    if type_.get_feature(FEATURE_BASE_NAME_BEGIN) is not None and type_.get_feature(FEATURE_BASE_NAME_END) is not None:
+        return _sort_key_annotation
+    return _sort_key_non_annotation
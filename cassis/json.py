@@ -1,13 +1,21 @@
 import base64
 import json
 import math
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from io import TextIOBase, TextIOWrapper
 from math import isnan
+from operator import attrgetter
+from typing import Iterator, Tuple
 
 from cassis.cas import NAME_DEFAULT_SOFA, Cas, IdGenerator, Sofa, View
 from cassis.typesystem import *
 
+try:
+    # orjson is an optional dependency that parses JSON considerably faster than the standard library
+    import orjson
+except ImportError:
+    orjson = None
+
 RESERVED_FIELD_PREFIX = "%"
 REF_FEATURE_PREFIX = "@"
 NUMBER_FEATURE_PREFIX = "#"
@@ -64,7 +72,9 @@ class CasJsonDeserializer:
     def __init__(self):
         self._max_xmi_id = 0
         self._max_sofa_num = 0
-        self._post_processors = []
+        # References to feature structures that have not been parsed yet are collected and resolved at the end
+        self._unresolved_references: List[Tuple[FeatureStructure, str, int]] = []
+        self._unresolved_fs_arrays: List[Tuple[FeatureStructure, List[int]]] = []
 
     def deserialize(
         self,
@@ -73,14 +83,18 @@ class CasJsonDeserializer:
         lenient: bool = False,
         merge_typesystem: bool = True,
     ) -> Cas:
-        if isinstance(source, str):
+        if orjson is not None:
+            # orjson accepts str as well as bytes, so whatever a file-like source returns can be parsed directly
+            data = orjson.loads(source if isinstance(source, str) else source.read())
+        elif isinstance(source, str):
             data = json.loads(source)
         else:
             data = json.load(source)
 
         self._max_xmi_id = 0
         self._max_sofa_num = 0
-        self._post_processors = []
+        self._unresolved_references = []
+        self._unresolved_fs_arrays = []
 
         if merge_typesystem:
             json_typesystem = data.get(TYPES_FIELD)
@@ -88,17 +102,30 @@ class CasJsonDeserializer:
                 add_document_annotation_type=not (json_typesystem.get(FLAG_DOCUMENT_ANNOTATION))
             )
 
-            # First, build a dependency graph to support cases where a child type is defined before its super type
-            type_dependencies = defaultdict(set)
+            # First, group the types by their super type to support cases where a child type is defined before its
+            # super type. Every type has exactly one super type, so the types form a tree.
+            subtypes_by_supertype = defaultdict(list)
             for type_name, json_type in json_typesystem.items():
-                type_dependencies[type_name].add(json_type[SUPER_TYPE_FIELD])
+                subtypes_by_supertype[json_type[SUPER_TYPE_FIELD]].append(type_name)
 
-            # Second, load all the types but no features since features of a type X might be of a later loaded type Y
-            for type_name in toposort_flatten(type_dependencies):
-                if is_predefined(type_name) or embedded_typesystem.contains_type(type_name):
-                    continue
+            # Second, load all the types but no features since features of a type X might be of a later loaded type Y.
+            # Walking the tree from the super types that are not declared in the JSON (e.g. predefined types)
+            # guarantees that each type is created after its super type.
+            supertype_names = deque(name for name in subtypes_by_supertype if name not in json_typesystem)
+            num_visited_types = 0
+            while supertype_names:
+                for type_name in subtypes_by_supertype.get(supertype_names.popleft(), ()):
+                    supertype_names.append(type_name)
+                    num_visited_types += 1
+
+                    if is_predefined(type_name) or embedded_typesystem.contains_type(type_name):
+                        continue
 
-                self._parse_type(embedded_typesystem, type_name, json_typesystem[type_name])
+                    self._parse_type(embedded_typesystem, type_name, json_typesystem[type_name])
+
+            # Types that cannot be reached from outside the JSON type system inherit from each other in a cycle
+            if num_visited_types != len(json_typesystem):
+                raise ValueError("The type system contains types with a circular super type hierarchy")
 
             # Now we are sure we know all the types, we can create the features
             for type_name, json_type in json_typesystem.items():
@@ -156,8 +183,14 @@ class CasJsonDeserializer:
                 if json_fs.get(TYPE_FIELD) != TYPE_NAME_SOFA:
                     parse_and_add(fs_id, json_fs)
 
-        for post_processor in self._post_processors:
-            post_processor()
+        for fs, feature_name, target_id in self._unresolved_references:
+            setattr(fs, feature_name, feature_structures.get(target_id))
+
+        for fs, element_ids in self._unresolved_fs_arrays:
+            fs.elements = [feature_structures.get(e) for e in element_ids]
+
+        # All parsed feature structures are keyed by their id, so the largest id can be taken in one go
+        self._max_xmi_id = max(feature_structures, default=0)
 
         cas._xmi_id_generator = IdGenerator(self._max_xmi_id + 1)
         cas._sofa_num_generator = IdGenerator(self._max_sofa_num + 1)
@@ -212,9 +245,7 @@ class CasJsonDeserializer:
 
     def _parse_view(self, cas: Cas, view_name: str, json_view: Dict[str, any], feature_structures: Dict[str, any]):
         view = self._get_or_create_view(cas, view_name)
-        for member_id in json_view[VIEW_MEMBERS_FIELD]:
-            fs = feature_structures[member_id]
-            view.add(fs, keep_id=True)
+        view.add_all((feature_structures[member_id] for member_id in json_view[VIEW_MEMBERS_FIELD]), keep_id=True)
 
     def _parse_sofa(self, cas: Cas, fs_id: int, json_fs: Dict[str, any], feature_structures: Dict[int, any]) -> Sofa:
         view = self._get_or_create_view(
@@ -236,41 +267,36 @@ class CasJsonDeserializer:
             type_name = array_type_name_for_type(type_name)
         AnnotationType = typesystem.get_type(type_name)
 
-        attributes = dict(json_fs)
+        # Build the constructor arguments in a single pass instead of copying the JSON object and rewriting it. All
+        # prefixes are single characters, so we can dispatch on the first character of each key.
+        attributes = {}
+        ref_features = {}
+        for key, value in json_fs.items():
+            prefix = key[:1]
+            if prefix == RESERVED_FIELD_PREFIX:
+                continue
+            elif prefix == REF_FEATURE_PREFIX:
+                ref_features[key[1:]] = value
+            elif prefix == NUMBER_FEATURE_PREFIX:
+                attributes[key[1:]] = self._parse_float_value(value)
+            elif key == "self" or key == "type":
+                # Remap features that use a reserved Python name
+                attributes[key + "_"] = value
+            else:
+                attributes[key] = value
 
         # Map the JSON FS ID to xmiID
         attributes["xmiID"] = fs_id
 
-        # Remap features that use a reserved Python name
-        if "self" in attributes:
-            attributes["self_"] = attributes.pop("self")
-
-        if "type" in attributes:
-            attributes["type_"] = attributes.pop("type")
-
         if typesystem.is_primitive_array(AnnotationType.name):
             attributes["elements"] = self._parse_primitive_array(AnnotationType.name, json_fs.get(ELEMENTS_FIELD))
-        elif AnnotationType.name == TYPE_NAME_FS_ARRAY:
-            # Resolve id-ref at the end of processing
-            def fix_up(elements):
-                return lambda: setattr(fs, "elements", [feature_structures.get(e) for e in elements])
 
-            self._post_processors.append(fix_up(json_fs.get(ELEMENTS_FIELD)))
-
-        self._strip_reserved_json_keys(attributes)
-
-        ref_features = {}
-        for key, value in list(attributes.items()):
-            if key.startswith(REF_FEATURE_PREFIX):
-                ref_features[key[1:]] = value
-                attributes.pop(key)
-            if key.startswith(NUMBER_FEATURE_PREFIX):
-                attributes[key[1:]] = self._parse_float_value(value)
-                attributes.pop(key)
-
-        self._max_xmi_id = max(attributes["xmiID"], self._max_xmi_id)
         fs = AnnotationType(**attributes)
 
+        if AnnotationType.name == TYPE_NAME_FS_ARRAY:
+            # Resolve id-ref at the end of processing
+            self._unresolved_fs_arrays.append((fs, json_fs.get(ELEMENTS_FIELD)))
+
         self._resolve_references(fs, ref_features, feature_structures)
 
         # Map from offsets in UIMA UTF-16 based offsets to Unicode codepoints
@@ -301,6 +327,10 @@ class CasJsonDeserializer:
         if elements and type_name == TYPE_NAME_BYTE_ARRAY:
             return base64.b64decode(elements)
         if elements and (type_name == TYPE_NAME_FLOAT_ARRAY or type_name == TYPE_NAME_DOUBLE_ARRAY):
+            # Only the special values like NaN are encoded as strings. If there are none, the JSON parser already
+            # produced the final floats, which we can check for in one go without converting each element.
+            if set(map(type, elements)) == {float}:
+                return elements
             return [self._parse_float_value(v) for v in elements]
         else:
             return elements
@@ -313,25 +343,15 @@ class CasJsonDeserializer:
                 setattr(fs, key, target_fs)
             else:
                 # Resolve id-ref at the end of processing
-                def fix_up(k, v):
-                    return lambda: setattr(fs, k, feature_structures.get(v))
-
-                self._post_processors.append(fix_up(key, value))
-
-    def _strip_reserved_json_keys(
-        self,
-        attributes: Dict[str, any],
-    ):
-        for key in list(attributes):
-            if key.startswith(RESERVED_FIELD_PREFIX):
-                attributes.pop(key)
+                self._unresolved_references.append((fs, key, value))
 
 
 class CasJsonSerializer:
     _COMMON_FIELD_NAMES = {"xmiID", "type"}
 
     def __init__(self):
-        pass
+        # How to serialize the features of a type is the same for all its feature structures, so we decide it once
+        self._features_by_type_name: Dict[str, List[Tuple[str, str, bool, bool, bool]]] = {}
 
     def serialize(
         self,
@@ -341,24 +361,9 @@ class CasJsonSerializer:
         ensure_ascii: bool = False,
         type_system_mode: TypeSystemMode = TypeSystemMode.FULL,
     ) -> Union[str, None]:
-        feature_structures = []
-
-        views = {}
-        for view in cas.views:
-            views[view.sofa.sofaID] = self._serialize_view(view)
-
-            if view.sofa.sofaArray:
-                json_sofa_array_fs = self._serialize_feature_structure(view.sofa.sofaArray)
-                feature_structures.append(json_sofa_array_fs)
-            json_sofa_fs = self._serialize_feature_structure(view.sofa)
-            feature_structures.append(json_sofa_fs)
-
-        # Find all fs, even the ones that are not directly added to a sofa
-        used_types = set()
-        for fs in sorted(cas._find_all_fs(include_inlinable_arrays_and_lists=True), key=lambda a: a.xmiID):
-            used_types.add(fs.type)
-            json_fs = self._serialize_feature_structure(fs)
-            feature_structures.append(json_fs)
+        # Find all fs, even the ones that are not directly added to a sofa. They are ordered with timsort for the same
+        # reason as in the XMI serializer: it beats bucketing them by id, as the ids are already mostly ascending.
+        all_fs = sorted(cas._find_all_fs(include_inlinable_arrays_and_lists=True), key=attrgetter("xmiID"))
 
         types = None
         if type_system_mode is not TypeSystemMode.NONE:
@@ -366,6 +371,7 @@ class CasJsonSerializer:
 
             if type_system_mode is TypeSystemMode.MINIMAL:
                 # Build transitive closure of used types by following parents, features, etc.
+                used_types = {fs.type for fs in all_fs}
                 types_to_include = cas.typesystem.transitive_closure(used_types)
             elif type_system_mode is TypeSystemMode.FULL:
                 types_to_include = cas.typesystem.get_types()
@@ -378,36 +384,65 @@ class CasJsonSerializer:
                 json_type = self._serialize_type(type_)
                 types[json_type[NAME_FIELD]] = json_type
 
-        data = {}
-        if types is not None:
-            data[TYPES_FIELD] = types
-        if feature_structures is not None:
-            data[FEATURE_STRUCTURES_FIELD] = feature_structures
-        if views is not None:
+        views = {}
+        for view in cas.views:
+            views[view.sofa.sofaID] = self._serialize_view(view)
+
+        indent = 2 if pretty_print else None
+
+        if not sink:
+            # The whole document ends up in memory as a string anyway, so we let the encoder handle it in one go
+            data = {}
+            if types is not None:
+                data[TYPES_FIELD] = types
+            data[FEATURE_STRUCTURES_FIELD] = list(self._iter_json_feature_structures(cas, all_fs))
             data[VIEWS_FIELD] = views
+            return json.dumps(data, sort_keys=False, indent=indent, ensure_ascii=ensure_ascii, allow_nan=False)
 
-        if sink and not isinstance(sink, TextIOBase):
+        if not isinstance(sink, TextIOBase):
             sink = TextIOWrapper(sink, encoding="utf-8", write_through=True)
 
-        if sink:
-            json.dump(
-                data,
-                sink,
-                sort_keys=False,
-                indent=2 if pretty_print else None,
-                ensure_ascii=ensure_ascii,
-                allow_nan=False,
-            )
+        # When writing to a sink, the feature structures are converted and written one at a time instead of first
+        # building the whole document in memory. The output is the same as if the document had been encoded at once.
+        encode = json.JSONEncoder(sort_keys=False, indent=indent, ensure_ascii=ensure_ascii, allow_nan=False).encode
+        if pretty_print:
+            field_indent, element_indent = "\n  ", "\n    "
+            field_separator, element_separator = "," + field_indent, "," + element_indent
         else:
-            return json.dumps(
-                data, sort_keys=False, indent=2 if pretty_print else None, ensure_ascii=ensure_ascii, allow_nan=False
+            field_indent = element_indent = ""
+            field_separator = element_separator = ", "
+
+        sink.write("{" + field_indent)
+        if types is not None:
+            sink.write(encode(TYPES_FIELD) + ": " + encode(types).replace("\n", field_indent) + field_separator)
+
+        sink.write(encode(FEATURE_STRUCTURES_FIELD) + ": [")
+        is_empty = True
+        for json_fs in self._iter_json_feature_structures(cas, all_fs):
+            sink.write(
+                (element_indent if is_empty else element_separator) + encode(json_fs).replace("\n", element_indent)
             )
+            is_empty = False
+        sink.write(("" if is_empty else field_indent) + "]" + field_separator)
+
+        sink.write(encode(VIEWS_FIELD) + ": " + encode(views).replace("\n", field_indent))
+        sink.write(("\n" if pretty_print else "") + "}")
 
         if isinstance(sink, TextIOWrapper):
             sink.detach()  # Prevent TextIOWrapper from closing the BytesIO
 
         return None
 
+    def _iter_json_feature_structures(self, cas: Cas, all_fs: List[FeatureStructure]) -> Iterator[dict]:
+        # The sofas (and their data arrays) come first, followed by all other feature structures
+        for view in cas.views:
+            if view.sofa.sofaArray:
+                yield self._serialize_feature_structure(view.sofa.sofaArray)
+            yield self._serialize_feature_structure(view.sofa)
+
+        for fs in all_fs:
+            yield self._serialize_feature_structure(fs)
+
     def _serialize_type(self, type_: Type):
         type_name = self._to_external_type_name(type_.name)
         supertype_name = self._to_external_type_name(type_.supertype.name)
@@ -484,38 +519,63 @@ class CasJsonSerializer:
                 json_fs[ELEMENTS_FIELD] = [self._serialize_ref(e) for e in fs.elements]
             return json_fs
 
-        for feature in fs.type.all_features:
-            if feature.name in CasJsonSerializer._COMMON_FIELD_NAMES:
-                continue
-
-            feature_name = feature.name
-
-            # Strip the underscore we added for reserved names
-            if feature._has_reserved_name:
-                feature_name = feature.name[:-1]
+        features = self._features_by_type_name.get(type_name)
+        if features is None:
+            features = self._collect_features(fs.type)
+            self._features_by_type_name[type_name] = features
 
+        for attribute_name, feature_name, is_offset, has_float_range, has_primitive_range in features:
             # Skip over 'None' features
-            value = getattr(fs, feature.name)
+            value = getattr(fs, attribute_name)
             if value is None:
                 continue
 
             # Map back from offsets in Unicode codepoints to UIMA UTF-16 based offsets
-            if feature.domainType.name == TYPE_NAME_ANNOTATION and feature_name == "begin" or feature_name == "end":
+            if is_offset:
                 sofa: Sofa = getattr(fs, "sofa")
                 value = sofa._offset_converter.python_to_external(value)
 
-            if feature.rangeType.name in {TYPE_NAME_DOUBLE, TYPE_NAME_FLOAT}:
+            if has_float_range:
                 float_value = self._serialize_float_value(value)
                 if isinstance(float_value, str):
                     feature_name = NUMBER_FEATURE_PREFIX + feature_name
-                json_fs[feature_name] = self._serialize_float_value(value)
-            elif is_primitive(feature.rangeType):
+                json_fs[feature_name] = float_value
+            elif has_primitive_range:
                 json_fs[feature_name] = value
             else:
                 # We need to encode non-primitive features as a reference
                 json_fs[REF_FEATURE_PREFIX + feature_name] = self._serialize_ref(value)
         return json_fs
 
+    def _collect_features(self, type_: Type) -> List[Tuple[str, str, bool, bool, bool]]:
+        """Collects the features of the given type that need to be serialized together with their JSON name and the
+        checks that only depend on the feature, so that they are not repeated for every feature structure."""
+        features = []
+        for feature in type_.all_features:
+            if feature.name in CasJsonSerializer._COMMON_FIELD_NAMES:
+                continue
+
+            feature_name = feature.name
+
+            # Strip the underscore we added for reserved names
+            if feature._has_reserved_name:
+                feature_name = feature.name[:-1]
+
+            is_offset = (
+                feature.domainType.name == TYPE_NAME_ANNOTATION and feature_name == "begin" or feature_name == "end"
+            )
+
+            features.append(
+                (
+                    feature.name,
+                    feature_name,
+                    is_offset,
+                    feature.rangeType.name in {TYPE_NAME_DOUBLE, TYPE_NAME_FLOAT},
+                    is_primitive(feature.rangeType),
+                )
+            )
+        return features
+
     def _serialize_float_value(self, value) -> Union[float, str]:
         if isnan(value):
             return NAN_VALUE
@@ -535,7 +595,7 @@ class CasJsonSerializer:
     def _serialize_view(self, view: View):
         return {
             VIEW_SOFA_FIELD: view.sofa.xmiID,
-            VIEW_MEMBERS_FIELD: sorted(x.xmiID for x in view.get_all_annotations()),
+            VIEW_MEMBERS_FIELD: sorted(map(attrgetter("xmiID"), view.iter_all_annotations())),
         }
 
     def _to_external_type_name(self, type_name: str):
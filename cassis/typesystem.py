@@ -1,4 +1,5 @@
 import re
+import sys
 import warnings
 from collections import defaultdict
 from copy import copy
@@ -6,7 +7,7 @@ from enum import Enum, auto
 from io import BytesIO
 from itertools import chain, filterfalse
 from pathlib import Path
-from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Set, Union
+from typing import IO, Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Set, Union
 
 import attr
 from deprecation import deprecated
@@ -568,6 +569,7 @@ class Type:
     _constructor_fn = attr.ib(init=False, eq=False, order=False, repr=False)
     _constructor: Callable[[Dict], FeatureStructure] = attr.ib(default=None, eq=False, order=False, repr=False)
     _cached_all_features = attr.ib(default=None, eq=False, order=False, repr=False)
+    _cached_descendant_names = attr.ib(default=None, eq=False, order=False, repr=False)
 
     def __attrs_post_init__(self):
         """Build the constructor that can create feature structures of this type"""
@@ -710,6 +712,16 @@ class Type:
             for child in self._children.values():
                 yield from child.descendants
 
+    @property
+    def _descendant_names(self) -> FrozenSet[str]:
+        """Returns the names of the type and all its descendant types. Selecting feature structures needs these on
+        every call, so we cache them. The cache is cleared when a subtype is added, see `TypeSystem.create_type`.
+        """
+        if self._cached_descendant_names is None:
+            self._cached_descendant_names = frozenset(t.name for t in self.descendants)
+
+        return self._cached_descendant_names
+
     def subsumes(self, other_type: "Type") -> bool:
         """Determines if the type `other_type` is a child of `self`.
 
@@ -866,12 +878,22 @@ class TypeSystem:
         if self.contains_type(name) and not is_predefined(name):
             raise ValueError(f"Type with name [{name}] already exists!")
 
+        # Type names are used as keys in many dictionaries, e.g. the type index of each view. Interning them lets
+        # lookups with the name of a type succeed by identity instead of comparing the strings.
+        name = sys.intern(name)
+
         supertype = self.get_type(supertypeName)
         new_type = Type(name=name, supertype=supertype, description=description, typesystem=self)
 
         if name != TOP_TYPE_NAME:
             supertype._children[name] = new_type
 
+            # The new type is a descendant of all its ancestors
+            ancestor = supertype
+            while ancestor is not None:
+                ancestor._cached_descendant_names = None
+                ancestor = ancestor.supertype
+
             for feature in supertype.all_features:
                 new_type._add_feature(feature, inherited=True)
 
@@ -50,7 +50,12 @@ doc_dependencies = [
     "sphinx-rtd-theme"
 ]
 
+speedups_dependencies = [
+    "orjson>=3.6,<4"
+]
+
 extras = {
+    "speedups": speedups_dependencies,
     "test": test_dependencies,
     "dev":  dev_dependencies,
     "doc":  doc_dependencies
@@ -3,7 +3,7 @@ from timeit import default_timer as timer
 
 import pytest
 
-from cassis import load_cas_from_json, load_cas_from_xmi
+from cassis import Cas, TypeSystem, load_cas_from_json, load_cas_from_xmi
 from tests.test_files.test_cas_generators import MultiFeatureRandomCasGenerator
 
 generator = MultiFeatureRandomCasGenerator()
@@ -67,3 +67,24 @@ def test_json_deserialization_performance():
     print(
         f"JSON: Deserializing {iterations} CASes with {generator.size} each took {end - start} seconds ({len(randomized_cas_json_bytes)} bytes each)"
     )
+
+
+@pytest.mark.performance
+def test_select_covered_while_adding_performance():
+    ts = TypeSystem()
+    Token = ts.create_type("Token")
+    Sentence = ts.create_type("Sentence")
+    cas = Cas(ts)
+    cas.add_all([Token(begin=i, end=i + 1) for i in range(0, 100000, 2)])
+    sentence = Sentence(begin=1000, end=1100)
+    rnd = Random(123456)
+    rounds = 2000
+
+    start = timer()
+    for i in range(0, rounds):
+        begin = rnd.randrange(100000)
+        cas.add(Token(begin=begin, end=begin + 1))
+        cas.select_covered(Token, sentence)
+    end = timer()
+
+    print(f"Alternating {rounds} times between adding a token and selecting covered tokens took {end - start} seconds")
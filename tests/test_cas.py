@@ -1,9 +1,13 @@
+import copy
+import pickle
 import random
 
 import attr
 
+from cassis.cas import IdGenerator
 from cassis.typesystem import (
     TYPE_NAME_ANNOTATION,
+    TYPE_NAME_FS_LIST,
     TYPE_NAME_INTEGER,
     TYPE_NAME_INTEGER_ARRAY,
     TYPE_NAME_STRING,
@@ -174,6 +178,53 @@ def test_select_covered(small_typesystem_xml, tokens, sentences):
     assert list(cas.select_covered(ts.get_type("cassis.Token"), second_sentence)) == tokens_in_second_sentence
 
 
+def test_select_covered_while_adding_and_removing_annotations(small_typesystem_xml):
+    ts = load_typesystem(small_typesystem_xml)
+    TokenType = ts.get_type("cassis.Token")
+    SentenceType = ts.get_type("cassis.Sentence")
+    cas = Cas(typesystem=ts)
+    rnd = random.Random(42)
+    cas.add_all([TokenType(begin=i, end=i + 1) for i in range(0, 1000, 2)])
+
+    for _ in range(200):
+        begin = rnd.randrange(1000)
+        cas.add(TokenType(begin=begin, end=begin + rnd.randrange(1, 5)))
+        if rnd.random() < 0.3:
+            cas.remove(rnd.choice(list(cas.select(TokenType))))
+
+        window_begin = rnd.randrange(900)
+        window = SentenceType(begin=window_begin, end=window_begin + rnd.randrange(100))
+        expected = [t for t in cas.select(TokenType) if window.begin <= t.begin and t.end <= window.end]
+
+        assert list(cas.select_covered(TokenType, window)) == expected
+
+
+def test_select_covered_uses_end_offsets_changed_after_indexing(small_typesystem_xml, tokens, sentences):
+    ts = load_typesystem(small_typesystem_xml)
+    cas = Cas(typesystem=ts)
+    cas.add_all(tokens + sentences)
+    first_sentence, _ = sentences
+    tokens_in_first_sentence = tokens[:6]
+    assert list(cas.select_covered("cassis.Token", first_sentence)) == tokens_in_first_sentence
+
+    tokens_in_first_sentence[-1].end = first_sentence.end + 1
+
+    assert list(cas.select_covered("cassis.Token", first_sentence)) == tokens_in_first_sentence[:-1]
+
+
+def test_select_covered_uses_begin_offsets_changed_after_indexing(small_typesystem_xml, tokens, sentences):
+    ts = load_typesystem(small_typesystem_xml)
+    cas = Cas(typesystem=ts)
+    cas.add_all(tokens + sentences)
+    _, second_sentence = sentences
+    tokens_in_second_sentence = tokens[6:]
+    assert list(cas.select_covered("cassis.Token", second_sentence)) == tokens_in_second_sentence
+
+    tokens_in_second_sentence[0].begin = second_sentence.begin - 1
+
+    assert list(cas.select_covered("cassis.Token", second_sentence)) == tokens_in_second_sentence[1:]
+
+
 def test_select_covered_overlapping(small_typesystem_xml, tokens, sentences):
     ts = load_typesystem(small_typesystem_xml)
     cas = Cas(typesystem=ts)
@@ -214,6 +265,21 @@ def test_select_covered_also_returns_parent_instances(small_typesystem_xml, toke
     assert set(actual_tokens_in_second_sentence) == set(tokens_in_second_sentence + [subtoken2])
 
 
+def test_select_covered_returns_instances_of_all_subtypes_in_offset_order(small_typesystem_xml, tokens, sentences):
+    typesystem = load_typesystem(small_typesystem_xml)
+    SubTokenType = typesystem.create_type("cassis.SubToken", supertypeName="cassis.Token")
+
+    subtoken = SubTokenType(begin=tokens[2].begin, end=tokens[3].end)
+    cas = Cas(typesystem=typesystem)
+    cas.add_all(tokens + sentences + [subtoken])
+
+    actual = cas.select_covered("cassis.Token", sentences[0])
+
+    expected = tokens[:3] + [subtoken] + tokens[3:6]
+    assert len(actual) == len(expected)
+    assert all(a is e for a, e in zip(actual, expected))
+
+
 def test_select_covering(small_typesystem_xml, tokens, sentences):
     ts = load_typesystem(small_typesystem_xml)
     cas = Cas(typesystem=ts)
@@ -318,6 +384,18 @@ def test_FeatureStructure_get_covered_text_sentences(sentences):
     assert actual_text == expected_text
 
 
+def test_get_covered_texts(small_typesystem_xml):
+    typesystem = load_typesystem(small_typesystem_xml)
+    TokenType = typesystem.get_type("cassis.Token")
+    cas = Cas(typesystem)
+    cas.sofa_string = "Joe waited for the train ."
+    cas.add_all([TokenType(begin=0, end=3), TokenType(begin=4, end=10), TokenType(begin=11, end=14)])
+
+    actual_text = cas.get_covered_texts(cas.select("cassis.Token"))
+
+    assert actual_text == ["Joe", "waited", "for"]
+
+
 # Adding annotations
 
 
@@ -362,6 +440,43 @@ def test_add_annotation_generates_ids(small_typesystem_xml, tokens):
     assert all([token.xmiID is not None for token in actual_tokens])
 
 
+def test_deepcopy_continues_generating_ids(small_typesystem_xml):
+    typesystem = load_typesystem(small_typesystem_xml)
+    cas = Cas(typesystem)
+    TokenType = typesystem.get_type("cassis.Token")
+    cas.add(TokenType(begin=0, end=3))
+
+    copied_cas = copy.deepcopy(cas)
+    original_token = TokenType(begin=4, end=10)
+    copied_token = TokenType(begin=4, end=10)
+    cas.add(original_token)
+    copied_cas.add(copied_token)
+
+    assert copied_token.xmiID == original_token.xmiID
+
+
+def test_id_generator_can_be_pickled():
+    generator = IdGenerator(5)
+    assert generator.generate_id() == 5
+
+    unpickled_generator = pickle.loads(pickle.dumps(generator))
+
+    assert unpickled_generator.generate_id() == 6
+    assert generator.generate_id() == 6
+
+
+def test_id_generator_does_not_repeat_ids_when_copied_while_in_use():
+    generator = IdGenerator()
+    generate_id = generator.generate_id
+
+    ids = [generate_id(), generate_id()]
+    copy.deepcopy(generator)
+    ids.append(generate_id())
+    ids.append(generator.generate_id())
+
+    assert ids == [1, 2, 3, 4]
+
+
 def test_annotations_are_ordered_correctly(small_typesystem_xml, tokens):
     typesystem = load_typesystem(small_typesystem_xml)
     cas = Cas(typesystem)
@@ -377,6 +492,55 @@ def test_annotations_are_ordered_correctly(small_typesystem_xml, tokens):
     assert actual_tokens == tokens
 
 
+def test_type_index_returns_empty_index_for_types_without_annotations(small_typesystem_xml, tokens):
+    typesystem = load_typesystem(small_typesystem_xml)
+    cas = Cas(typesystem)
+    cas.add_all(tokens)
+    view = cas.views[0]
+
+    assert list(view.type_index["cassis.Sentence"]) == []
+    assert list(view.type_index) == ["cassis.Token"]
+
+
+def test_add_all_orders_annotations_correctly(small_typesystem_xml, tokens, sentences):
+    typesystem = load_typesystem(small_typesystem_xml)
+    cas = Cas(typesystem)
+
+    annotations = tokens + sentences
+    random.shuffle(annotations)
+
+    cas.add_all(annotations)
+
+    assert list(cas.select("cassis.Token")) == tokens
+    assert list(cas.select("cassis.Sentence")) == sentences
+    assert all(annotation.xmiID is not None for annotation in annotations)
+    assert all(annotation.sofa is cas.get_sofa() for annotation in annotations)
+
+
+def test_add_all_indexes_annotations_before_one_with_unknown_type(small_typesystem_xml, tokens):
+    typesystem = load_typesystem(small_typesystem_xml)
+    cas = Cas(typesystem)
+    other_typesystem = TypeSystem()
+    UnknownType = other_typesystem.create_type("test.Unknown", supertypeName=TYPE_NAME_ANNOTATION)
+
+    with pytest.raises(RuntimeError, match="Typesystem of CAS does not contain type"):
+        cas.add_all(tokens[:2] + [UnknownType(begin=0, end=1)] + tokens[2:])
+
+    assert list(cas.select("cassis.Token")) == tokens[:2]
+
+
+def test_annotations_added_after_select_are_indexed(small_typesystem_xml, tokens):
+    typesystem = load_typesystem(small_typesystem_xml)
+    cas = Cas(typesystem)
+
+    cas.add_all(tokens[3:])
+    assert list(cas.select("cassis.Token")) == tokens[3:]
+
+    for token in reversed(tokens[:3]):
+        cas.add(token)
+    assert list(cas.select("cassis.Token")) == tokens
+
+
 def test_leniency_type_not_in_typeystem_not_lenient(small_typesystem_xml):
     typesystem = load_typesystem(small_typesystem_xml)
 
@@ -410,6 +574,20 @@ def test_select_returns_children_fs_instances(cas_with_inheritance_xmi, typesyst
     assert len(list(cas.select("cassis.GrandGrandGrandChild"))) == 1
 
 
+def test_select_returns_instances_of_subtypes_created_after_selecting():
+    cas = Cas()
+    cas.sofa_string = "Joe waited"
+    ParentType = cas.typesystem.create_type("test.Parent", supertypeName=TYPE_NAME_ANNOTATION)
+    cas.add(ParentType(begin=0, end=3))
+    assert len(cas.select("test.Parent")) == 1
+
+    ChildType = cas.typesystem.create_type("test.Child", supertypeName="test.Parent")
+    cas.add(ChildType(begin=4, end=10))
+
+    assert len(cas.select("test.Parent")) == 2
+    assert len(cas.select(TYPE_NAME_ANNOTATION)) == 2
+
+
 # Removing
 
 
@@ -463,6 +641,21 @@ def test_removing_throws_if_fs_in_other_view(small_typesystem_xml, tokens, sente
         view.remove(tokens[0])
 
 
+def test_removing_removes_the_given_fs_if_offsets_are_equal(small_typesystem_xml):
+    typesystem = load_typesystem(small_typesystem_xml)
+    TokenType = typesystem.get_type("cassis.Token")
+    first = TokenType(begin=0, end=3, id="0")
+    second = TokenType(begin=0, end=3, id="1")
+
+    cas = Cas(typesystem)
+    cas.add_all([first, second])
+    cas.remove(second)
+
+    remaining = list(cas.select("cassis.Token"))
+    assert len(remaining) == 1
+    assert remaining[0] is first
+
+
 def test_removing_many_annotations():
     typesystem = TypeSystem()
     NamedEntity = typesystem.create_type(name="NamedEntity", supertypeName=TYPE_NAME_ANNOTATION)
@@ -522,6 +715,29 @@ def test_scanning_for_transitively_referenced_integer_array():
     assert int_array in all_fs
 
 
+def test_scanning_inlined_fs_list_whose_head_was_already_visited():
+    typesystem = TypeSystem()
+    Foo = typesystem.create_type("Foo", supertypeName=TYPE_NAME_TOP)
+    Bar = typesystem.create_type("Bar", supertypeName=TYPE_NAME_TOP)
+    typesystem.create_feature(Foo, "members", rangeType=TYPE_NAME_FS_LIST, elementType="Bar")
+    NonEmptyFSList = typesystem.get_type("uima.cas.NonEmptyFSList")
+    EmptyFSList = typesystem.get_type("uima.cas.EmptyFSList")
+
+    cas = Cas(typesystem)
+    first = Bar()
+    second = Bar()
+    foo = Foo(members=NonEmptyFSList(head=first, tail=NonEmptyFSList(head=second, tail=EmptyFSList())))
+    # The first head is indexed itself and thus visited before the list is scanned
+    cas.add(first)
+    cas.add(foo)
+
+    all_fs = list(cas._find_all_fs())
+
+    assert len(all_fs) == 3
+    assert {id(fs) for fs in all_fs} == {id(first), id(second), id(foo)}
+    load_cas_from_xmi(cas.to_xmi(), typesystem=typesystem)
+
+
 def test_covered_text_on_non_annotation():
     cas = Cas()
     Top = cas.typesystem.get_type(TYPE_NAME_TOP)
@@ -1,5 +1,6 @@
 import json
 
+import cassis.json
 from cassis.typesystem import TYPE_NAME_ANNOTATION, TypeSystemMode, TYPE_NAME_DOCUMENT_ANNOTATION
 from tests.fixtures import *
 from tests.test_files.test_cas_generators import MultiFeatureRandomCasGenerator, MultiTypeRandomCasGenerator
@@ -122,6 +123,35 @@ def test_deserialization_serialization_one_way(json_path, annotations):
     assert_json_equal(actual_json, expected_json, sort_keys=True)
 
 
+@pytest.mark.parametrize("pretty_print", [True, False])
+@pytest.mark.parametrize("json_path, annotations", ROUND_TRIP_FIXTURES)
+def test_serializing_to_file_matches_serializing_to_string(tmpdir, json_path, annotations, pretty_print):
+    with open(os.path.join(json_path, "data.json"), "rb") as f:
+        cas = load_cas_from_json(f)
+    path = str(tmpdir.join("data.json"))
+
+    cas.to_json(path, pretty_print=pretty_print)
+
+    with open(path, "r", encoding="utf-8") as f:
+        assert f.read() == cas.to_json(pretty_print=pretty_print)
+
+
+@pytest.mark.parametrize("from_string", [True, False])
+@pytest.mark.parametrize("json_path, annotations", ROUND_TRIP_FIXTURES)
+def test_deserialization_without_orjson(monkeypatch, json_path, annotations, from_string):
+    monkeypatch.setattr(cassis.json, "orjson", None)
+
+    with open(os.path.join(json_path, "data.json"), "r", encoding="utf-8") as f:
+        cas = load_cas_from_json(f.read() if from_string else f)
+
+    with open(os.path.join(json_path, "data.json"), "rb") as f:
+        expected_json = json.load(f)
+
+    actual_json = cas.to_json(pretty_print=True)
+
+    assert_json_equal(actual_json, expected_json, sort_keys=True)
+
+
 def test_multi_type_random_serialization_deserialization():
     generator = MultiTypeRandomCasGenerator()
     for i in range(0, 10):
@@ -207,3 +237,17 @@ def test_recursive_type_system():
 def test_deserializing_type_system_if_child_type_is_defined_before_supertype():
     with open(os.path.join(FIXTURE_DIR, "child_type_before_parent.json"), "rb") as f:
         load_cas_from_json(f)
+
+
+def test_deserializing_type_system_with_circular_supertypes_fails():
+    json_cas = {
+        "%TYPES": {
+            "example.TypeA": {"%NAME": "example.TypeA", "%SUPER_TYPE": "example.TypeB"},
+            "example.TypeB": {"%NAME": "example.TypeB", "%SUPER_TYPE": "example.TypeA"},
+        },
+        "%FEATURE_STRUCTURES": [],
+        "%VIEWS": {},
+    }
+
+    with pytest.raises(ValueError):
+        load_cas_from_json(json.dumps(json_cas))
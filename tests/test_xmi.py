@@ -371,6 +371,40 @@ def test_leniency_type_not_in_typesystem_not_lenient(cas_with_leniency_xmi, smal
         cas = load_cas_from_xmi(cas_with_leniency_xmi, typesystem=typesystem, lenient=False)
 
 
+def test_comments_inside_feature_structures_are_ignored():
+    xmi = """<?xml version="1.0" encoding="UTF-8"?>
+        <xmi:XMI xmlns:xmi="http://www.omg.org/XMI" xmlns:cas="http:///uima/cas.ecore" xmi:version="2.0">
+            <cas:NULL xmi:id="0" />
+            <cas:StringArray xmi:id="2">
+                <!-- A comment -->
+                <elements>blah</elements>
+                <?processing instruction?>
+                <elements>blub</elements>
+            </cas:StringArray>
+            <cas:Sofa xmi:id="1" sofaNum="1" sofaID="_InitialView" mimeType="text" sofaString="Test" />
+            <cas:View sofa="1" members="2" />
+        </xmi:XMI>"""
+
+    cas = load_cas_from_xmi(xmi)
+
+    assert [fs.elements for fs in cas.select("uima.cas.StringArray")] == [["blah", "blub"]]
+
+
+def test_deeply_nested_elements_are_rejected():
+    xmi = """<?xml version="1.0" encoding="UTF-8"?>
+        <xmi:XMI xmlns:xmi="http://www.omg.org/XMI" xmlns:cas="http:///uima/cas.ecore" xmi:version="2.0">
+            <cas:NULL xmi:id="0" />
+            <cas:StringArray xmi:id="2">
+                <elements><elements>blah</elements></elements>
+            </cas:StringArray>
+            <cas:Sofa xmi:id="1" sofaNum="1" sofaID="_InitialView" mimeType="text" sofaString="Test" />
+            <cas:View sofa="1" members="2" />
+        </xmi:XMI>"""
+
+    with pytest.raises(RuntimeError):
+        load_cas_from_xmi(xmi)
+
+
 def test_multiple_references_allowed_true():
     typesystem = TypeSystem()
     Foo = typesystem.create_type("Foo")